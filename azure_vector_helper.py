@@ -1,20 +1,40 @@
 # azure_search_rest_helper.py
 
-import requests
-import os
 import json
-from dotenv import load_dotenv
+from functools import lru_cache
+from pathlib import Path
+import orjson
+from config import load_settings
 import logging
+from log_setup import configure_logging
+from http_helper import create_session
+from index_manifest import IndexManifest, index_id
 
 # Configure logging
-logging.basicConfig(
-    filename='RAG/azure_search_rest_helper.log',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+configure_logging('RAG/azure_search_rest_helper.log')
+
+@lru_cache(maxsize=8)
+def _load_index_definition(path: str) -> dict:
+    """
+    Reads and parses an index definition file once per process.
+
+    :param path: Path to the index definition JSON file.
+    :return: The parsed index definition. The cached dict is shared and must not be modified.
+    """
+    return orjson.loads(Path(path).read_bytes())
 
 class AzureSearchRESTHelper:
+    __slots__ = (
+        "endpoint",
+        "api_key",
+        "index_name",
+        "api_version",
+        "index_definition_file",
+        "session",
+        "index_definition",
+        "_index_url"
+    )
+
     def __init__(self, env_file: str = "local.env", index_definition_file: str = "index_definition.json"):
         """
         Initializes the AzureSearchRESTHelper by loading environment variables and the index definition.
@@ -22,11 +42,11 @@ class AzureSearchRESTHelper:
         :param env_file: Path to the environment variables file.
         :param index_definition_file: Path to the index definition JSON file.
         """
-        load_dotenv(dotenv_path=env_file)
+        settings = load_settings(env_file)
         
-        self.endpoint = os.getenv("ACS_ENDPOINT")
-        self.api_key = os.getenv("ACS_API_KEY")
-        self.index_name = os.getenv("ACS_INDEX_NAME", "knowledge-index")
+        self.endpoint = settings.acs_endpoint
+        self.api_key = settings.acs_api_key
+        self.index_name = settings.acs_index_name or "knowledge-index"
         self.api_version = "2024-07-01"  # Ensure this matches your target API version
         self.index_definition_file = index_definition_file
         
@@ -35,10 +55,12 @@ class AzureSearchRESTHelper:
             logging.error(error_msg)
             raise ValueError(error_msg)
         
+        self.session = create_session(self.api_key)
+        self._index_url = f"{self.endpoint}/indexes/{self.index_name}?api-version={self.api_version}"
+        
         # Read the index definition from the JSON file
         try:
-            with open(self.index_definition_file, "r", encoding="utf-8") as f:
-                self.index_definition = json.load(f)
+            self.index_definition = _load_index_definition(self.index_definition_file)
             logging.info(f"Loaded index definition from '{self.index_definition_file}'.")
         except FileNotFoundError:
             error_msg = f"Index definition file '{self.index_definition_file}' not found."
@@ -55,13 +77,7 @@ class AzureSearchRESTHelper:
 
         :return: None
         """
-        url = f"{self.endpoint}/indexes/{self.index_name}?api-version={self.api_version}"
-        headers = {
-            "Content-Type": "application/json",
-            "api-key": self.api_key
-        }
-        
-        response = requests.put(url, headers=headers, json=self.index_definition)
+        response = self.session.put(self._index_url, json=self.index_definition)
         
         if response.status_code in [200, 201]:
             logging.info(f"Index '{self.index_name}' created/updated successfully.")
@@ -80,19 +96,16 @@ class AzureSearchRESTHelper:
 
         :return: None
         """
-        url = f"{self.endpoint}/indexes/{self.index_name}?api-version={self.api_version}"
-        headers = {
-            "api-key": self.api_key
-        }
-        
-        response = requests.delete(url, headers=headers)
+        response = self.session.delete(self._index_url)
         
         if response.status_code == 204:
             logging.info(f"Index '{self.index_name}' deleted successfully.")
             print(f"Index '{self.index_name}' deleted successfully.")
+            self._clear_manifest()
         elif response.status_code == 404:
             logging.warning(f"Index '{self.index_name}' does not exist.")
             print(f"Index '{self.index_name}' does not exist.")
+            self._clear_manifest()
         else:
             try:
                 error_message = response.json().get("error", {}).get("message", response.text)
@@ -100,3 +113,21 @@ class AzureSearchRESTHelper:
                 error_message = response.text
             logging.error(f"Failed to delete index '{self.index_name}': {error_message}")
             raise Exception(f"Failed to delete index '{self.index_name}': {error_message}")
+
+    def _clear_manifest(self):
+        """
+        Forgets the documents recorded as indexed in this index, so the next ingestion run
+        uploads them all again.
+
+        :return: None
+        """
+        try:
+            manifest = IndexManifest(index_id(self.endpoint, self.index_name))
+            try:
+                manifest.clear()
+            finally:
+                manifest.close()
+            logging.info(f"Cleared the index manifest of '{self.index_name}'.")
+        except Exception as e:
+            logging.error(f"Failed to clear the index manifest of '{self.index_name}': {e}")
+            print(f"Failed to clear the index manifest of '{self.index_name}': {e}")
@@ -0,0 +1,51 @@
+# config.py
+
+"""
+Loads the environment file once per process and exposes its values as an immutable settings
+object, so helpers created repeatedly do not re-read the file or re-query the environment.
+"""
+
+import os
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+DEFAULT_ENV_FILE = "local.env"
+
+
+class Settings(NamedTuple):
+    acs_endpoint: Optional[str]
+    acs_api_key: Optional[str]
+    acs_index_name: Optional[str]
+    acs_api_version: str
+    azure_openai_endpoint: Optional[str]
+    azure_openai_api_key: Optional[str]
+    azure_openai_api_version: str
+    azure_openai_engine: str
+    openai_chat_model: str
+    current_user_id: str
+
+
+@lru_cache(maxsize=8)
+def load_settings(env_file: str = DEFAULT_ENV_FILE) -> Settings:
+    """
+    Loads the environment variables from a file and reads the settings. Each file is only
+    loaded the first time it is requested.
+
+    :param env_file: Path to the environment variables file.
+    :return: The settings read from the environment.
+    """
+    load_dotenv(dotenv_path=env_file)
+    return Settings(
+        acs_endpoint=os.getenv("ACS_ENDPOINT"),
+        acs_api_key=os.getenv("ACS_API_KEY"),
+        acs_index_name=os.getenv("ACS_INDEX_NAME"),
+        acs_api_version=os.getenv("ACS_API_VERSION", "2024-07-01"),
+        azure_openai_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        azure_openai_api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        azure_openai_api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2023-07-01-preview"),
+        azure_openai_engine=os.getenv("AZURE_OPENAI_ENGINE", "text-embedding-ada-002"),
+        openai_chat_model=os.getenv("OPENAI_CHAT_MODEL", "gpt-4"),
+        current_user_id=os.getenv("CURRENT_USER_ID", "userXYZ")
+    )
@@ -0,0 +1,112 @@
+# embedding_cache.py
+
+"""
+Content-addressed cache for embedding vectors, with an in-memory LRU layer in front of
+an on-disk store so identical text is only embedded once across runs.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import diskcache
+import numpy as np
+
+
+class EmbeddingCache:
+    def __init__(self, engine: str, cache_dir: str = "./.embed_cache", maxsize: int = 10000, quantize: bool = False):
+        """
+        Initializes the EmbeddingCache.
+
+        :param engine: Embedding model deployment. Keys are namespaced by it so switching models
+                       never returns vectors produced by another model.
+        :param cache_dir: Directory of the on-disk cache. Pass None to keep the cache in memory only.
+        :param maxsize: Maximum number of vectors kept in memory.
+        :param quantize: Store vectors on disk as int8 with a per-vector scale, a quarter of the
+                         float32 size. Vectors are dequantized to float32 when read back.
+        """
+        self.engine = engine
+        self.maxsize = maxsize
+        self.quantize = quantize
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = diskcache.Cache(cache_dir) if cache_dir else None
+
+    def key(self, text: str) -> str:
+        """
+        Builds the cache key for a text.
+
+        :param text: The embedded text.
+        :return: SHA-256 hex digest of the engine and text.
+        """
+        return hashlib.sha256(f"{self.engine}:{text}".encode("utf-8")).hexdigest()
+
+    def get(self, text: str):
+        """
+        Looks up the embedding of a text, first in memory and then on disk.
+
+        :param text: The embedded text.
+        :return: The embedding vector as a float32 numpy array, or None on a miss.
+        """
+        key = self.key(text)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        if self._disk is None:
+            return None
+        raw = self._disk.get(self._disk_key(key))
+        if raw is None:
+            return None
+
+        embedding = self._decode(raw)
+        self._remember(key, embedding)
+        return embedding
+
+    def set(self, text: str, embedding: list) -> None:
+        """
+        Stores the embedding of a text in memory and on disk.
+
+        :param text: The embedded text.
+        :param embedding: The embedding vector as a float32 numpy array.
+        """
+        key = self.key(text)
+        self._remember(key, embedding)
+        if self._disk is not None:
+            self._disk.set(self._disk_key(key), self._encode(embedding))
+
+    def _disk_key(self, key: str) -> str:
+        """
+        Quantized vectors use their own keys so switching `quantize` never misreads stored bytes.
+        """
+        return f"{key}:q8" if self.quantize else key
+
+    def _encode(self, embedding: np.ndarray) -> bytes:
+        """
+        Serializes a vector as raw float32 bytes, or as a float32 scale followed by int8 values.
+        """
+        if not self.quantize:
+            return embedding.astype(np.float32).tobytes()
+        scale = float(np.abs(embedding).max()) / 127 or 1.0
+        quantized = np.round(embedding / scale).astype(np.int8)
+        return np.float32(scale).tobytes() + quantized.tobytes()
+
+    def _decode(self, raw: bytes) -> np.ndarray:
+        """
+        Restores a float32 vector from the bytes written by `_encode`.
+        """
+        if not self.quantize:
+            return np.frombuffer(raw, dtype=np.float32).copy()
+        scale = np.frombuffer(raw[:4], dtype=np.float32)[0]
+        return np.frombuffer(raw[4:], dtype=np.int8).astype(np.float32) * scale
+
+    def _remember(self, key: str, embedding: np.ndarray) -> None:
+        """
+        Adds an entry to the in-memory LRU layer, evicting the least recently used entry when full.
+        """
+        with self._lock:
+            self._memory[key] = embedding
+            self._memory.move_to_end(key)
+            if len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
@@ -1,23 +1,38 @@
 # embedding_helper.py
 
-import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+import httpx
+import numpy as np
 import openai
-from dotenv import load_dotenv
+import orjson
+from config import load_settings
+from embedding_cache import EmbeddingCache
+from http_helper import create_openai_session, retry_transient
+
+# Maximum number of inputs Azure OpenAI accepts in a single embeddings request
+MAX_INPUTS_PER_REQUEST = 2048
+# Maximum number of embeddings requests the synchronous API sends at the same time
+MAX_CONCURRENT_REQUESTS = 8
 
 class EmbeddingHelper:
-    def __init__(self, env_file: str = "local.env"):
+    __slots__ = ("api_type", "api_base", "api_version", "api_key", "engine", "cache", "query_cache", "_embeddings_url", "_headers")
+
+    def __init__(self, env_file: str = "local.env", cache_dir: str = "./.embed_cache"):
         """
         Initializes the EmbeddingHelper by loading environment variables from a specified file.
         
         :param env_file: Path to the environment variables file (default: "local.env")
+        :param cache_dir: Directory of the on-disk embedding cache. Pass None to cache in memory only.
         """
-        load_dotenv(dotenv_path=env_file)
+        settings = load_settings(env_file)
         
         self.api_type = "azure"
-        self.api_base = os.getenv("AZURE_OPENAI_ENDPOINT")
-        self.api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2023-03-15-preview")
-        self.api_key = os.getenv("AZURE_OPENAI_API_KEY")
-        self.engine = os.getenv("AZURE_OPENAI_ENGINE", "text-embedding-ada-002")
+        self.api_base = settings.azure_openai_endpoint
+        self.api_version = settings.azure_openai_api_version
+        self.api_key = settings.azure_openai_api_key
+        self.engine = settings.azure_openai_engine
         
         if not all([self.api_base, self.api_key, self.engine]):
             raise ValueError("Azure OpenAI configuration is incomplete. Please check your local.env file.")
@@ -26,21 +41,222 @@ class EmbeddingHelper:
         openai.api_base = self.api_base
         openai.api_version = self.api_version
         openai.api_key = self.api_key
+        # Embedding and chat calls share one connection pool
+        if openai.requestssession is None:
+            openai.requestssession = create_openai_session()
+
+        self.cache = EmbeddingCache(self.engine, cache_dir=cache_dir)
+        # Query embeddings are kept in memory only, apart from the document embeddings
+        self.query_cache = EmbeddingCache(self.engine, cache_dir=None, maxsize=2048)
+
+        # Built once and shared by every async request
+        self._embeddings_url = (
+            f"{self.api_base.rstrip('/')}/openai/deployments/{self.engine}/embeddings?api-version={self.api_version}"
+        )
+        self._headers = MappingProxyType({
+            "Content-Type": "application/json",
+            "api-key": self.api_key
+        })
 
     def get_embedding(self, text: str) -> list:
         """
         Generate an embedding for the given text using Azure OpenAI.
 
         :param text: The input text to embed.
-        :return: A list of floats representing the embedding vector.
+        :return: The embedding vector as a float32 numpy array.
+        """
+        return self.get_embeddings([text])[0]
+
+    def get_embeddings(self, texts: list) -> list:
+        """
+        Generate embeddings for many texts, sending up to MAX_INPUTS_PER_REQUEST inputs per request.
+
+        Texts whose embedding is already cached are not sent to the API.
+
+        :param texts: The input texts to embed.
+        :return: A list of float32 embedding vectors, in the same order as the input texts.
+        """
+        embeddings, missing = self._lookup_cached(texts)
+        if not missing:
+            return embeddings
+
+        fetched = self._create_embeddings(missing)
+        return self._store_fetched(texts, embeddings, missing, fetched)
+
+    def get_query_embedding(self, text: str) -> np.ndarray:
+        """
+        Generate an embedding for a search query. Query embeddings are kept in the in-memory
+        `query_cache` rather than the document embedding cache, so repeated searches for the same
+        query only call the API once. The returned array is shared and must not be modified.
+
+        :param text: The query text to embed.
+        :return: The embedding vector as a float32 numpy array.
+        """
+        embedding = self.query_cache.get(text)
+        if embedding is None:
+            embedding = self._create_embeddings([text])[0]
+            embedding.flags.writeable = False
+            self.query_cache.set(text, embedding)
+        return embedding
+
+    def _create_embeddings(self, texts: list) -> list:
+        """
+        Call the embeddings API, sending up to MAX_INPUTS_PER_REQUEST inputs per request.
+        When the texts need several requests, up to MAX_CONCURRENT_REQUESTS of them are sent
+        concurrently from a thread pool.
+
+        :param texts: The input texts to embed.
+        :return: A list of float32 embedding vectors, in the same order as the input texts.
+        """
+        batches = [texts[start:start + MAX_INPUTS_PER_REQUEST] for start in range(0, len(texts), MAX_INPUTS_PER_REQUEST)]
+        try:
+            if len(batches) > 1:
+                with ThreadPoolExecutor(max_workers=min(len(batches), MAX_CONCURRENT_REQUESTS)) as executor:
+                    responses = list(executor.map(self._create_embeddings_request, batches))
+            else:
+                responses = [self._create_embeddings_request(batch) for batch in batches]
+            return [embedding for response in responses for embedding in self._ordered_embeddings(response)]
+        except Exception as e:
+            print(f"Error generating embedding: {e}")
+            raise
+
+    @retry_transient
+    def _create_embeddings_request(self, batch: list):
+        """
+        Send a single embeddings request, backing off and retrying on rate limits and transient failures.
+        """
+        return openai.Embedding.create(input=batch, engine=self.engine)
+
+    async def get_query_embedding_async(self, client: httpx.AsyncClient, text: str) -> np.ndarray:
+        """
+        Asynchronously generate an embedding for a search query. Shares `query_cache` with
+        `get_query_embedding`. The returned array must not be modified.
+
+        :param client: httpx async client used to send the request.
+        :param text: The query text to embed.
+        :return: The embedding vector as a float32 numpy array.
+        """
+        embeddings = await self.get_query_embeddings_async(client, [text])
+        return embeddings[0]
+
+    async def get_query_embeddings_async(self, client: httpx.AsyncClient, texts: list) -> list:
+        """
+        Asynchronously generate embeddings for a query and related texts (such as recent
+        conversation turns). Texts missing from `query_cache` are sent in a single request.
+        The returned arrays must not be modified.
+
+        :param client: httpx async client used to send the request.
+        :param texts: The texts to embed, at most MAX_INPUTS_PER_REQUEST.
+        :return: A list of float32 embedding vectors, in the same order as the input texts.
+        """
+        embeddings = [self.query_cache.get(text) for text in texts]
+        missing = [text for text, embedding in zip(texts, embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+
+        try:
+            fetched = iter(await self._create_embeddings_request_async(client, missing))
+        except Exception as e:
+            print(f"Error generating embedding: {e}")
+            raise
+        for i, text in enumerate(texts):
+            if embeddings[i] is None:
+                embedding = next(fetched)
+                embedding.flags.writeable = False
+                self.query_cache.set(text, embedding)
+                embeddings[i] = embedding
+        return embeddings
+
+    async def get_embedding_async(self, client: httpx.AsyncClient, text: str) -> list:
+        """
+        Asynchronously generate an embedding for the given text by calling the Azure OpenAI
+        REST endpoint directly, so many embeddings can be requested concurrently.
+
+        :param client: httpx async client used to send the request.
+        :param text: The input text to embed.
+        :return: The embedding vector as a float32 numpy array.
+        """
+        embeddings = await self.get_embeddings_async(client, [text])
+        return embeddings[0]
+
+    async def get_embeddings_async(self, client: httpx.AsyncClient, texts: list, max_concurrency: int = 20) -> list:
+        """
+        Asynchronously generate embeddings for many texts. Inputs are split into requests of up to
+        MAX_INPUTS_PER_REQUEST texts, which are sent concurrently. Texts whose embedding is
+        already cached are not sent to the API.
+
+        :param client: httpx async client used to send the requests.
+        :param texts: The input texts to embed.
+        :param max_concurrency: Maximum number of requests in flight at the same time.
+        :return: A list of float32 embedding vectors, in the same order as the input texts.
         """
+        embeddings, missing = self._lookup_cached(texts)
+        if not missing:
+            return embeddings
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def embed_batch(batch: list) -> list:
+            async with semaphore:
+                return await self._create_embeddings_request_async(client, batch)
+
         try:
-            response = openai.Embedding.create(
-                input=[text],
-                engine=self.engine
-            )
-            embedding = response["data"][0]["embedding"]
-            return embedding
+            batches = await asyncio.gather(*(
+                embed_batch(missing[start:start + MAX_INPUTS_PER_REQUEST])
+                for start in range(0, len(missing), MAX_INPUTS_PER_REQUEST)
+            ))
+            fetched = [embedding for batch in batches for embedding in batch]
+            return self._store_fetched(texts, embeddings, missing, fetched)
         except Exception as e:
             print(f"Error generating embedding: {e}")
             raise
+
+    @retry_transient
+    async def _create_embeddings_request_async(self, client: httpx.AsyncClient, batch: list) -> list:
+        """
+        Asynchronously send a single embeddings request, backing off and retrying on rate limits and transient failures.
+
+        :return: The float32 embedding vectors of the batch, in input order.
+        """
+        response = await client.post(self._embeddings_url, headers=self._headers, content=orjson.dumps({"input": batch}))
+        response.raise_for_status()
+        return self._ordered_embeddings(orjson.loads(response.content))
+
+    def _lookup_cached(self, texts: list) -> tuple:
+        """
+        Look up every text in the embedding cache.
+
+        :param texts: The input texts to embed.
+        :return: A tuple of the cached embeddings (None for misses) and the unique texts that missed.
+        """
+        embeddings = [self.cache.get(text) for text in texts]
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        return embeddings, missing
+
+    def _store_fetched(self, texts: list, embeddings: list, missing: list, fetched: list) -> list:
+        """
+        Write freshly generated embeddings to the cache and merge them with the cached ones.
+
+        :param texts: The input texts to embed.
+        :param embeddings: Cached embeddings as returned by `_lookup_cached`.
+        :param missing: The texts that were sent to the API.
+        :param fetched: The embeddings returned by the API for `missing`.
+        :return: A list of float32 embedding vectors, in the same order as the input texts.
+        """
+        fetched_by_text = dict(zip(missing, fetched))
+        for text, embedding in fetched_by_text.items():
+            self.cache.set(text, embedding)
+        return [
+            embedding if embedding is not None else fetched_by_text[text]
+            for text, embedding in zip(texts, embeddings)
+        ]
+
+    @staticmethod
+    def _ordered_embeddings(response: dict) -> list:
+        """
+        Extract the embedding vectors from an embeddings response, ordered like the inputs.
+
+        :param response: Parsed embeddings response.
+        :return: A list of float32 embedding vectors.
+        """
+        return [np.asarray(d["embedding"], dtype=np.float32) for d in sorted(response["data"], key=lambda d: d["index"])]
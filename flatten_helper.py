@@ -3,8 +3,20 @@
 """
 Utility functions to flatten (serialize) different field types into a textual representation
 based on the "fieldType" property.
+
+The module is fully type-annotated and free of I/O so it can be compiled with mypyc
+(`mypyc flatten_helper.py`) for CPU-bound bulk ingestion; imports stay unchanged.
 """
 
+from typing import Any, Callable, Dict, List, Tuple
+
+# Address components in the order they appear in the flattened text
+_ADDRESS_KEYS: Tuple[str, ...] = ("line1", "line2", "city", "state", "zip")
+
+# Formats a (column, value) pair of a table row as 'column=value'
+_format_cell: Callable[[Tuple[str, Any]], str] = "{0[0]}={0[1]}".format
+
+
 def flatten_checkbox_field(field_name: str, value: bool) -> str:
     """
     Convert a checkbox field into text: 'FieldName: Checked' or 'FieldName: Unchecked'.
@@ -20,7 +32,7 @@ def flatten_text_field(field_name: str, value: str) -> str:
     return f"{field_name}: {value}"
 
 
-def flatten_number_field(field_name: str, value) -> str:
+def flatten_number_field(field_name: str, value: Any) -> str:
     """
     Convert a number field into 'FieldName: 123'.
     """
@@ -42,7 +54,7 @@ def flatten_date_field(field_name: str, value: str) -> str:
     return f"{field_name}: {value}"
 
 
-def flatten_address_field(field_name: str, address_value: dict) -> str:
+def flatten_address_field(field_name: str, address_value: Dict[str, str]) -> str:
     """
     Convert an address object (with line1, line2, city, state, zip, etc.) to a single text line.
 
@@ -55,18 +67,11 @@ def flatten_address_field(field_name: str, address_value: dict) -> str:
       "zip": "12345"
     }
     """
-    line1 = address_value.get("line1", "")
-    line2 = address_value.get("line2", "")
-    city = address_value.get("city", "")
-    state = address_value.get("state", "")
-    zip_code = address_value.get("zip", "")
-    
-    parts = [line1, line2, city, state, zip_code]
-    joined = ", ".join(p for p in parts if p)
+    joined = ", ".join(filter(None, map(address_value.get, _ADDRESS_KEYS)))
     return f"{field_name}: {joined}"
 
 
-def flatten_table_field(field_name: str, rows: list) -> str:
+def flatten_table_field(field_name: str, rows: List[Dict[str, Any]]) -> str:
     """
     Convert a table (list of row objects) into a multiline string.
     Example rows:
@@ -79,14 +84,16 @@ def flatten_table_field(field_name: str, rows: list) -> str:
          Row1: [Item=Paper Clips, Quantity=3]
          Row2: [Item=Markers, Quantity=5]"
     """
-    lines = [f"{field_name}:"]
-    for i, row in enumerate(rows, start=1):
-        row_content = ", ".join(f"{k}={v}" for k, v in row.items())
-        lines.append(f"  Row{i}: [{row_content}]")
-    return "\n".join(lines)
+    if not rows:
+        return f"{field_name}:"
+    rows_text = "\n".join(
+        f"  Row{i}: [" + ", ".join(map(_format_cell, row.items())) + "]"
+        for i, row in enumerate(rows, start=1)
+    )
+    return f"{field_name}:\n{rows_text}"
 
 
-def flatten_signature_field(field_name: str, value: dict) -> str:
+def flatten_signature_field(field_name: str, value: Dict[str, Any]) -> str:
     """
     For a signature field, store a placeholder or minimal info.
     E.g. 'Signature: provided on 2025-04-15T10:00:00Z'
@@ -108,7 +115,7 @@ def flatten_signature_field(field_name: str, value: dict) -> str:
     return text
 
 
-def flatten_location_field(field_name: str, value: dict) -> str:
+def flatten_location_field(field_name: str, value: Dict[str, Any]) -> str:
     """
     If you have a location object, e.g. { "lat": 35.6895, "lon": 139.6917 }
     or an address string. Customize as needed.
@@ -120,71 +127,50 @@ def flatten_location_field(field_name: str, value: dict) -> str:
     return f"{field_name}: [Location data]"  # fallback
 
 
-def flatten_field(field_data: dict) -> str:
+def _flatten_default_field(field_name: str, value: Any) -> str:
+    """
+    Default fallback for unknown field types.
+    """
+    return f"{field_name}: {value}"
+
+
+# Maps each fieldType to a function taking (field_name, value). Values that do not have
+# the expected shape (e.g. a signature or location given as a string, which
+# submission.schema.json allows) fall back to a placeholder instead of failing the whole submission.
+_FIELD_FLATTENERS: Dict[str, Callable[[str, Any], str]] = {
+    "checkbox": lambda name, value: flatten_checkbox_field(name, bool(value)),
+    "text": lambda name, value: flatten_text_field(name, str(value)),
+    "number": flatten_number_field,
+    "password": lambda name, value: flatten_password_field(name),
+    "date": lambda name, value: flatten_date_field(name, str(value)),
+    "address": lambda name, value: (
+        flatten_address_field(name, value) if isinstance(value, dict) else f"{name}: [Invalid address data]"
+    ),
+    "table": lambda name, value: (
+        flatten_table_field(name, value) if isinstance(value, list) else f"{name}: [Invalid table data]"
+    ),
+    "signature": lambda name, value: (
+        flatten_signature_field(name, value) if isinstance(value, dict) else f"{name}: [Signature provided]"
+    ),
+    "location": lambda name, value: (
+        flatten_location_field(name, value) if isinstance(value, dict) else f"{name}: [Location data]"
+    ),
+}
+
+
+def flatten_field(field_data: Dict[str, Any]) -> str:
     """
     Given a single field dictionary with keys:
       "fieldType", "fieldName", and "value"
-    decide which flatten_* function to call.
+    look up which flatten_* function to call.
 
     Returns a single-line or multi-line string describing that field.
     """
-    field_type = field_data.get("fieldType")
-    field_name = field_data.get("fieldName", "UnknownField")
-    value = field_data.get("value")
-
-    if field_type == "checkbox":
-        # value should be boolean
-        return flatten_checkbox_field(field_name, bool(value))
-    
-    elif field_type == "text":
-        # value should be a string
-        # fallback if it's not
-        return flatten_text_field(field_name, str(value))
-    
-    elif field_type == "number":
-        return flatten_number_field(field_name, value)
-
-    elif field_type == "password":
-        return flatten_password_field(field_name)
-    
-    elif field_type == "date":
-        return flatten_date_field(field_name, str(value))
-    
-    elif field_type == "address":
-        # assume value is a dict with line1, line2, city, etc.
-        if isinstance(value, dict):
-            return flatten_address_field(field_name, value)
-        else:
-            # fallback
-            return f"{field_name}: [Invalid address data]"
-    
-    elif field_type == "table":
-        # assume value is a list of row objects
-        if isinstance(value, list):
-            return flatten_table_field(field_name, value)
-        else:
-            return f"{field_name}: [Invalid table data]"
-    
-    elif field_type == "signature":
-        # assume value is a dict with signature metadata
-        if isinstance(value, dict):
-            return flatten_signature_field(field_name, value)
-        else:
-            return f"{field_name}: [Signature provided]"
-    
-    elif field_type == "location":
-        # assume value is a dict with lat/lon
-        if isinstance(value, dict):
-            return flatten_location_field(field_name, value)
-        else:
-            return f"{field_name}: [Location data]"
-    
-    else:
-        # default fallback for unknown types
-        return f"{field_name}: {value}"
-
-
-def flatten_submission(submission_doc: dict) -> str:
+    flattener = _FIELD_FLATTENERS.get(field_data.get("fieldType", ""), _flatten_default_field)
+    return flattener(field_data.get("fieldName", "UnknownField"), field_data.get("value"))
+
+
+def flatten_submission(submission_doc: Dict[str, Any]) -> str:
     """
     High-level function to flatten an entire submission into a text block.
 
@@ -212,28 +198,16 @@ def flatten_submission(submission_doc: dict) -> str:
 
     Returns a multiline string summarizing the submission.
     """
-    lines = []
-    
-    # Basic submission info
-    submission_id = submission_doc.get("_id", "")
-    folder_id = submission_doc.get("folder_id", "")
-    document_id = submission_doc.get("document_id", "")
-    user_id = submission_doc.get("user_id", "")
-    timestamp = submission_doc.get("timestamp", "")
-    
-    lines.append(f"Submission (Result ID: {submission_id})")
-    lines.append(f"For Document: {document_id} in Folder: {folder_id}.")
-    lines.append(f"Owned by user: {user_id}.")
-    lines.append(f"Timestamp: {timestamp}.")
-    
-    field_values = submission_doc.get("fieldValues", [])
-    lines.append("Field Values:")
-    
-    # Loop through each field entry, flatten based on the fieldType
-    for field_entry in field_values:
-        flattened_text = flatten_field(field_entry)
-        # Indent for readability
-        lines.append("  " + flattened_text)
-    
-    # Join everything into a single multiline string
-    return "\n".join(lines)
+    header = (
+        f"Submission (Result ID: {submission_doc.get('_id', '')})\n"
+        f"For Document: {submission_doc.get('document_id', '')} in Folder: {submission_doc.get('folder_id', '')}.\n"
+        f"Owned by user: {submission_doc.get('user_id', '')}.\n"
+        f"Timestamp: {submission_doc.get('timestamp', '')}.\n"
+        "Field Values:"
+    )
+
+    # Flatten each field based on its fieldType, indented for readability,
+    # and join everything into a single multiline string in one pass
+    parts: List[str] = [header]
+    parts.extend("  " + flatten_field(field_entry) for field_entry in submission_doc.get("fieldValues", []))
+    return "\n".join(parts)
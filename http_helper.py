@@ -0,0 +1,132 @@
+# http_helper.py
+
+"""
+Shared HTTP client setup for the Azure REST helpers, and the retry policy for throttled or
+transiently failing Azure OpenAI and Azure Cognitive Search calls.
+"""
+
+import httpx
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+from urllib3.util.retry import Retry
+
+POOL_CONNECTIONS = 16
+POOL_MAXSIZE = 32
+MAX_CONNECTIONS = 64
+REQUEST_TIMEOUT = 30.0
+# HTTP statuses worth retrying: throttling and temporary server-side failures
+TRANSIENT_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+def create_session(api_key: str) -> requests.Session:
+    """
+    Creates a requests session that keeps connections alive between calls and retries
+    throttled (429) or unavailable (503) responses with exponential backoff.
+
+    :param api_key: Azure Cognitive Search API key sent with every request.
+    :return: A configured requests.Session.
+    """
+    retry = Retry(
+        total=5,
+        backoff_factor=0.3,
+        status_forcelist=[429, 503],
+        # Index uploads and searches are idempotent, so POST is safe to retry as well
+        allowed_methods=frozenset({"GET", "PUT", "POST", "DELETE"}),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "Content-Type": "application/json",
+        "api-key": api_key
+    })
+    return session
+
+
+def create_openai_session() -> requests.Session:
+    """
+    Creates a pooled requests session for the OpenAI SDK, so its calls reuse keep-alive
+    connections across threads instead of each thread opening its own. Throttling and connection
+    failures are retried by `retry_transient`, so the adapter does not retry.
+
+    :return: A configured requests.Session.
+    """
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _client_options() -> dict:
+    """
+    Options shared by the sync and async httpx clients. HTTP/2 multiplexes concurrent
+    requests over a single TLS connection per host.
+    """
+    return {
+        "http2": True,
+        "limits": httpx.Limits(max_keepalive_connections=POOL_MAXSIZE, max_connections=MAX_CONNECTIONS),
+        "timeout": httpx.Timeout(REQUEST_TIMEOUT)
+    }
+
+
+def create_client(api_key: str) -> httpx.Client:
+    """
+    Creates an HTTP/2 httpx client for Azure Cognitive Search with the JSON and api-key headers set.
+
+    :param api_key: Azure Cognitive Search API key sent with every request.
+    :return: A configured httpx.Client.
+    """
+    return httpx.Client(
+        headers={
+            "Content-Type": "application/json",
+            "api-key": api_key
+        },
+        **_client_options()
+    )
+
+
+def create_async_client() -> httpx.AsyncClient:
+    """
+    Creates an HTTP/2 httpx async client. It carries no default headers because it is shared
+    between services with different API keys.
+
+    :return: A configured httpx.AsyncClient.
+    """
+    return httpx.AsyncClient(**_client_options())
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """
+    Returns True for errors raised when a service asks the client to slow down, is temporarily
+    unavailable, or the connection failed, i.e. when sending the same request again may succeed.
+    """
+    if isinstance(exc, (
+        openai.error.RateLimitError,
+        openai.error.APIConnectionError,
+        openai.error.ServiceUnavailableError,
+        openai.error.Timeout,
+        openai.error.TryAgain
+    )):
+        return True
+    if isinstance(exc, openai.error.APIError):
+        return exc.http_status in TRANSIENT_STATUS_CODES
+    if isinstance(exc, httpx.TransportError):
+        return True
+    return isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code in TRANSIENT_STATUS_CODES
+
+
+# Retries transient failures with jittered exponential backoff, so concurrent callers do not
+# retry in lockstep; works for both sync and async functions
+retry_transient = retry(
+    wait=wait_random_exponential(multiplier=0.5, max=30),
+    stop=stop_after_attempt(6),
+    retry=retry_if_exception(_is_transient),
+    reraise=True
+)
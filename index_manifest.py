@@ -0,0 +1,125 @@
+# index_manifest.py
+
+"""
+Local record of what has already been indexed, so unchanged submissions can be skipped
+before paying for an embedding and an upload. Records are kept per search index, so a
+different or recreated index starts out empty.
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+
+SIMHASH_BITS = 64
+DEFAULT_MANIFEST_FILE = "RAG/index_manifest.db"
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def content_hash(text: str) -> str:
+    """
+    Returns the SHA-256 hex digest of a flattened document.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def simhash(text: str) -> int:
+    """
+    Returns a 64-bit SimHash of the words in a text. Texts that differ by only a few words
+    produce hashes that differ in only a few bits.
+    """
+    weights = [0] * SIMHASH_BITS
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        token_hash = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if token_hash >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def index_id(endpoint: str, index_name: str) -> str:
+    """
+    Returns the identifier under which the manifest records the documents of a search index.
+
+    :param endpoint: Azure Cognitive Search endpoint.
+    :param index_name: Name of the index.
+    """
+    return f"{endpoint.rstrip('/')}/indexes/{index_name}"
+
+
+class IndexManifest:
+    def __init__(self, index_id: str, path: str = DEFAULT_MANIFEST_FILE, max_simhash_distance: int = 0):
+        """
+        Initializes the IndexManifest, creating the SQLite database if needed.
+
+        :param index_id: Index the documents are recorded for, built with `index_id`.
+        :param path: Path to the SQLite database file.
+        :param max_simhash_distance: Documents whose SimHash differs from the indexed version in at most
+                                     this many bits count as unchanged. 0 only skips exact matches.
+        """
+        self.index_id = index_id
+        self.path = path
+        self.max_simhash_distance = max_simhash_distance
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS indexed_documents ("
+            "index_id TEXT NOT NULL, doc_id TEXT NOT NULL, content_hash TEXT NOT NULL, simhash TEXT NOT NULL, "
+            "PRIMARY KEY (index_id, doc_id))"
+        )
+        self._connection.commit()
+
+    def is_unchanged(self, doc_id: str, text: str) -> bool:
+        """
+        Checks whether a document was already indexed with the same (or, with a SimHash
+        threshold, nearly the same) content.
+
+        :param doc_id: Unique identifier for the document.
+        :param text: Flattened text of the document.
+        :return: True if the document can be skipped.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT content_hash, simhash FROM indexed_documents WHERE index_id = ? AND doc_id = ?",
+                (self.index_id, doc_id)
+            ).fetchone()
+        if row is None:
+            return False
+        if row[0] == content_hash(text):
+            return True
+        if self.max_simhash_distance <= 0:
+            return False
+        return bin(int(row[1], 16) ^ simhash(text)).count("1") <= self.max_simhash_distance
+
+    def update(self, documents: list) -> None:
+        """
+        Records documents as indexed.
+
+        :param documents: List of (doc_id, text) tuples that were uploaded successfully.
+        """
+        rows = [
+            (self.index_id, doc_id, content_hash(text), format(simhash(text), "016x"))
+            for doc_id, text in documents
+        ]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO indexed_documents (index_id, doc_id, content_hash, simhash) "
+                "VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._connection.commit()
+
+    def clear(self) -> None:
+        """
+        Forgets every document recorded for the index, e.g. after the index was deleted.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM indexed_documents WHERE index_id = ?", (self.index_id,))
+            self._connection.commit()
+
+    def close(self) -> None:
+        """
+        Closes the database connection.
+        """
+        with self._lock:
+            self._connection.close()
@@ -1,25 +1,101 @@
-import os
-import requests
-import json
-from dotenv import load_dotenv
+import asyncio
+import zlib
+from types import MappingProxyType
+import httpx
+import orjson
+from config import load_settings
+from http_helper import create_client, retry_transient
+
+# Maximum number of documents sent to Azure Cognitive Search in a single request
+DEFAULT_BATCH_SIZE = 1000
+
+class _BatchStream:
+    """
+    Request body for a batch upload that encodes the `{"value": [...]}` payload one document at a
+    time while it is sent, so the full JSON never has to be held in memory. Each iteration starts
+    from the beginning, which lets a retried request send the whole body again.
+
+    With `compress`, the chunks are gzip-compressed on the fly.
+    """
+
+    def __init__(self, documents: list, compress: bool = False):
+        self.documents = documents
+        self.compress = compress
+
+    def __iter__(self):
+        if not self.compress:
+            yield from self._json_chunks()
+            return
+        # Level 1 is nearly free in CPU terms and still shrinks float-heavy JSON several times
+        compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in self._json_chunks():
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    def _json_chunks(self):
+        yield b'{"value":['
+        for i, doc in enumerate(self.documents):
+            if i:
+                yield b','
+            yield orjson.dumps(doc, option=orjson.OPT_SERIALIZE_NUMPY)
+        yield b']}'
+
+    async def aiter_chunks(self):
+        """
+        Yields the same chunks for async clients, which need an async iterable body.
+        """
+        for chunk in self:
+            yield chunk
 
 class IndexingHelper:
-    def __init__(self, env_file: str = "local.env"):
+    __slots__ = (
+        "endpoint",
+        "api_key",
+        "index_name",
+        "api_version",
+        "batch_size",
+        "compress",
+        "_upload_headers",
+        "_async_headers",
+        "_index_url",
+        "client"
+    )
+
+    def __init__(self, env_file: str = "local.env", batch_size: int = DEFAULT_BATCH_SIZE, compress: bool = True):
         """
         Initializes the IndexingHelper by loading environment variables.
+
+        :param env_file: Path to the environment variables file.
+        :param batch_size: Maximum number of documents uploaded per request.
+        :param compress: Send upload bodies gzip-compressed (Content-Encoding: gzip).
         """
-        load_dotenv(dotenv_path=env_file)
+        settings = load_settings(env_file)
         
-        self.endpoint = os.getenv("ACS_ENDPOINT")
-        self.api_key = os.getenv("ACS_API_KEY")
-        self.index_name = os.getenv("ACS_INDEX_NAME")
+        self.endpoint = settings.acs_endpoint
+        self.api_key = settings.acs_api_key
+        self.index_name = settings.acs_index_name
         self.api_version = "2024-07-01"  # Ensure the correct API version
+        self.batch_size = batch_size
+        self.compress = compress
 
         if not all([self.endpoint, self.api_key, self.index_name]):
             raise ValueError("Azure Cognitive Search configuration is incomplete. Please check your .env file.")
 
-    def index_document(
-        self,
+        self.client = create_client(self.api_key)
+
+        # Built once and shared by every request; the sync client already sends the JSON and api-key headers
+        self._index_url = f"{self.endpoint}/indexes/{self.index_name}/docs/index?api-version={self.api_version}"
+        self._upload_headers = MappingProxyType({"Content-Encoding": "gzip"} if compress else {})
+        self._async_headers = MappingProxyType({
+            "Content-Type": "application/json",
+            "api-key": self.api_key,
+            **self._upload_headers
+        })
+
+    @staticmethod
+    def build_search_doc(
         doc_id: str,
         user_id: str,
         folder_id: str,
@@ -27,10 +103,11 @@ class IndexingHelper:
         doc_type: str,
         content_text: str,
         embedding_vector: list,
-        metadata: str = ""
-    ) -> None:
+        metadata: str = "",
+        content_hash: str = ""
+    ) -> dict:
         """
-        Upserts a single document into Azure Cognitive Search with vector data.
+        Builds the Azure Cognitive Search document for a single upload action.
 
         :param doc_id: Unique identifier for the document.
         :param user_id: ID of the user owning the document.
@@ -38,16 +115,12 @@ class IndexingHelper:
         :param document_id: ID of the document/form.
         :param doc_type: Type of the document (e.g., 'folder', 'document', 'result').
         :param content_text: Flattened text representation of the document.
-        :param embedding_vector: Embedding vector as a list of floats.
+        :param embedding_vector: Embedding vector as a float32 numpy array or a list of floats.
         :param metadata: Optional metadata as a JSON string or other relevant information.
+        :param content_hash: Optional hash of `content_text`, used to detect unchanged documents.
+        :return: Dictionary ready to be placed in the "value" array of an index request.
         """
-        url = f"{self.endpoint}/indexes/{self.index_name}/docs/index?api-version={self.api_version}"
-        headers = {
-            "Content-Type": "application/json",
-            "api-key": self.api_key
-        }
-
-        search_doc = {
+        return {
             "@search.action": "upload",  # Use 'upload' for adding or replacing documents
             "id": doc_id,
             "userId": user_id,
@@ -56,15 +129,178 @@ class IndexingHelper:
             "type": doc_type,
             "content": content_text,
             "contentVector": embedding_vector,
-            "metadata": metadata
+            "metadata": metadata,
+            "contentHash": content_hash
         }
 
-        payload = {"value": [search_doc]}
+    def index_document(
+        self,
+        doc_id: str,
+        user_id: str,
+        folder_id: str,
+        document_id: str,
+        doc_type: str,
+        content_text: str,
+        embedding_vector: list,
+        metadata: str = ""
+    ) -> None:
+        """
+        Upserts a single document into Azure Cognitive Search with vector data.
+
+        :param doc_id: Unique identifier for the document.
+        :param user_id: ID of the user owning the document.
+        :param folder_id: ID of the folder containing the document.
+        :param document_id: ID of the document/form.
+        :param doc_type: Type of the document (e.g., 'folder', 'document', 'result').
+        :param content_text: Flattened text representation of the document.
+        :param embedding_vector: Embedding vector as a float32 numpy array or a list of floats.
+        :param metadata: Optional metadata as a JSON string or other relevant information.
+        """
+        search_doc = self.build_search_doc(
+            doc_id=doc_id,
+            user_id=user_id,
+            folder_id=folder_id,
+            document_id=document_id,
+            doc_type=doc_type,
+            content_text=content_text,
+            embedding_vector=embedding_vector,
+            metadata=metadata
+        )
+        self.index_documents([search_doc])
+
+    def index_documents(self, documents: list, batch_size: int = None) -> None:
+        """
+        Upserts many documents into Azure Cognitive Search, sending one request per batch.
+
+        Azure Cognitive Search reports the outcome of every document separately, so a batch
+        can partially succeed. Failed documents are collected across all batches and reported
+        together once every batch has been sent.
 
-        try:
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            print(f"Successfully indexed document ID: {doc_id}")
-        except requests.exceptions.RequestException as e:
-            print(f"Failed to index document ID: {doc_id}. Error: {e}")
-            raise
+        :param documents: List of documents built with `build_search_doc`.
+        :param batch_size: Maximum number of documents per request. Defaults to the helper's batch size.
+        """
+        batch_size = batch_size or self.batch_size
+
+        failed = []
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start:start + batch_size]
+
+            try:
+                response = self._post_batch(batch)
+            except httpx.HTTPError as e:
+                print(f"Failed to index batch of {len(batch)} document(s) starting at position {start}. Error: {e}")
+                raise
+
+            failed.extend(self._collect_failures(orjson.loads(response.content)))
+
+        self._raise_for_failures(failed, len(documents))
+
+    @retry_transient
+    def _post_batch(self, batch: list) -> httpx.Response:
+        """
+        Sends one batch, backing off and retrying on throttling and transient failures.
+        """
+        # The body has no known length, so it is sent with chunked transfer encoding
+        response = self.client.post(self._index_url, headers=self._upload_headers, content=_BatchStream(batch, self.compress))
+        response.raise_for_status()
+        return response
+
+    async def index_document_async(
+        self,
+        client: httpx.AsyncClient,
+        doc_id: str,
+        user_id: str,
+        folder_id: str,
+        document_id: str,
+        doc_type: str,
+        content_text: str,
+        embedding_vector: list,
+        metadata: str = ""
+    ) -> None:
+        """
+        Asynchronously upserts a single document into Azure Cognitive Search with vector data.
+
+        :param client: httpx async client used to send the request.
+        :param doc_id: Unique identifier for the document.
+        :param user_id: ID of the user owning the document.
+        :param folder_id: ID of the folder containing the document.
+        :param document_id: ID of the document/form.
+        :param doc_type: Type of the document (e.g., 'folder', 'document', 'result').
+        :param content_text: Flattened text representation of the document.
+        :param embedding_vector: Embedding vector as a float32 numpy array or a list of floats.
+        :param metadata: Optional metadata as a JSON string or other relevant information.
+        """
+        search_doc = self.build_search_doc(
+            doc_id=doc_id,
+            user_id=user_id,
+            folder_id=folder_id,
+            document_id=document_id,
+            doc_type=doc_type,
+            content_text=content_text,
+            embedding_vector=embedding_vector,
+            metadata=metadata
+        )
+        await self.index_documents_async(client, [search_doc])
+
+    async def index_documents_async(self, client: httpx.AsyncClient, documents: list, batch_size: int = None) -> None:
+        """
+        Asynchronously upserts many documents into Azure Cognitive Search, sending all batches concurrently.
+
+        :param client: httpx async client used to send the requests.
+        :param documents: List of documents built with `build_search_doc`.
+        :param batch_size: Maximum number of documents per request. Defaults to the helper's batch size.
+        """
+        batch_size = batch_size or self.batch_size
+
+        async def post_batch(start: int) -> list:
+            batch = documents[start:start + batch_size]
+            try:
+                return await self._post_batch_async(client, batch)
+            except httpx.HTTPError as e:
+                print(f"Failed to index batch of {len(batch)} document(s) starting at position {start}. Error: {e}")
+                raise
+
+        batch_failures = await asyncio.gather(*(post_batch(start) for start in range(0, len(documents), batch_size)))
+        self._raise_for_failures([result for failed in batch_failures for result in failed], len(documents))
+
+    @retry_transient
+    async def _post_batch_async(self, client: httpx.AsyncClient, batch: list) -> list:
+        """
+        Asynchronously sends one batch, backing off and retrying on throttling and transient failures.
+
+        :return: Failed result entries of the batch.
+        """
+        body = _BatchStream(batch, self.compress)
+        response = await client.post(self._index_url, headers=self._async_headers, content=body.aiter_chunks())
+        response.raise_for_status()
+        return self._collect_failures(orjson.loads(response.content))
+
+    @staticmethod
+    def _collect_failures(response_body: dict) -> list:
+        """
+        Reports the per-document outcome of an index request and returns the failed results.
+
+        :param response_body: Parsed JSON body of the index response.
+        :return: List of result entries whose status is false.
+        """
+        failed = []
+        # 200 means every document succeeded, 207 means at least one of them failed
+        for result in response_body.get("value", []):
+            if result.get("status"):
+                print(f"Successfully indexed document ID: {result.get('key')}")
+            else:
+                failed.append(result)
+                print(f"Failed to index document ID: {result.get('key')}. Error: {result.get('errorMessage')}")
+        return failed
+
+    @staticmethod
+    def _raise_for_failures(failed: list, total: int) -> None:
+        """
+        Raises if any document in an indexing run failed.
+
+        :param failed: Failed result entries collected from every batch.
+        :param total: Total number of documents sent.
+        """
+        if failed:
+            failed_keys = ", ".join(str(result.get("key")) for result in failed)
+            raise Exception(f"Failed to index {len(failed)} of {total} document(s): {failed_keys}")
@@ -0,0 +1,43 @@
+# log_setup.py
+
+"""
+Non-blocking logging setup. Log records are put on an in-memory queue and written to the
+log file by a background listener thread, so logging calls never wait on disk I/O.
+"""
+
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+def configure_logging(filename: str, level: int = logging.INFO) -> None:
+    """
+    Routes the root logger through a queue to a background file writer.
+
+    Like logging.basicConfig, only the first call in a process has an effect; later calls
+    from other modules keep the handler that is already installed.
+
+    :param filename: Path of the log file, opened in append mode.
+    :param level: Level of the root logger.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    file_handler = logging.FileHandler(filename, mode='a')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.Queue(-1)
+    _listener = QueueListener(log_queue, file_handler)
+    _listener.start()
+    # Flush records still in the queue when the process exits
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
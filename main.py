@@ -2,30 +2,50 @@
 
 import os
 import json
+import asyncio
+import glob
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+import fastjsonschema
+import orjson
 from flatten_helper import flatten_submission
+from http_helper import create_async_client
 from embedding_helper import EmbeddingHelper
 from indexing_helper import IndexingHelper
-from dotenv import load_dotenv
+from index_manifest import IndexManifest, content_hash, index_id
+from config import load_settings
 import logging
+from log_setup import configure_logging
 
 # Configure logging
-logging.basicConfig(
-    filename='RAG/main.log',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+configure_logging('RAG/main.log')
+
+# Maximum number of embedding requests in flight at the same time
+MAX_CONCURRENCY = 20
+# Validator compiled once from the submission JSON schema
+_VALIDATE_SUBMISSION = fastjsonschema.compile(
+    orjson.loads(Path(__file__).with_name("submission.schema.json").read_bytes())
 )
+# Number of threads loading and flattening submission files
+MAX_WORKERS = 16
+
+@lru_cache(maxsize=1024)
+def _read_submission(file_path: str) -> dict:
+    """
+    Reads and parses a submission file once per process.
+    """
+    return orjson.loads(Path(file_path).read_bytes())
 
 def load_submission(file_path: str) -> dict:
     """
     Load the submission document from a JSON file.
 
     :param file_path: Path to the JSON file.
-    :return: Dictionary representing the submission.
+    :return: Dictionary representing the submission. The cached dict is shared and must not be modified.
     """
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            submission = json.load(f)
+        submission = _read_submission(file_path)
         logging.info(f"Loaded submission from '{file_path}'.")
         return submission
     except FileNotFoundError:
@@ -35,77 +55,155 @@ def load_submission(file_path: str) -> dict:
         logging.error(f"Error decoding JSON from '{file_path}': {e}")
         raise
 
-def main():
-    # Load environment variables
-    load_dotenv(dotenv_path="local.env")
-
-    # Configuration
-    SUBMISSION_FILE = "RAG/submission.json"  # Path to your submission JSON file
+def prepare_submission(submission_file: str):
+    """
+    Load and flatten a single submission.
 
+    :param submission_file: Path to the submission JSON file.
+    :return: A (submission, text_summary) tuple, or None if the submission was skipped.
+    """
     # Step 1: Load the submission
     try:
-        submission = load_submission(SUBMISSION_FILE)
+        submission = load_submission(submission_file)
     except Exception as e:
         logging.error(f"Error loading submission: {e}")
         print(f"Error loading submission: {e}")
-        return
+        return None
+
+    # Validate the whole submission once, so the flatteners can rely on its shape
+    try:
+        _VALIDATE_SUBMISSION(submission)
+    except fastjsonschema.JsonSchemaException as e:
+        logging.error(f"Invalid submission '{submission_file}': {e}")
+        print(f"Invalid submission '{submission_file}': {e}")
+        return None
 
     # Step 2: Flatten the submission
     try:
         text_summary = flatten_submission(submission)
-        logging.info("Flattened Submission:")
-        logging.info(text_summary)
-        print("Flattened Submission:")
-        print(text_summary)
-        print("----")
+        # Only the id and size are recorded; the full summary is dumped at DEBUG level alone
+        doc_id = submission["_id"]
+        logging.debug(
+            "Flattened submission %s (%d characters).", doc_id, len(text_summary),
+            extra={"doc_id": doc_id, "len": len(text_summary)}
+        )
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Flattened submission %s:\n%s", doc_id, text_summary)
     except Exception as e:
         logging.error(f"Error flattening submission: {e}")
         print(f"Error flattening submission: {e}")
-        return
+        return None
+
+    return submission, text_summary
+
+async def embed_and_index(
+    prepared: list,
+    embedder: EmbeddingHelper,
+    indexing_helper: IndexingHelper,
+    manifest: IndexManifest
+):
+    """
+    Embed flattened submissions in batched requests, index them in batches and record them in the manifest.
+
+    :param prepared: List of (submission, text_summary) tuples.
+    :param embedder: Helper used to generate the embeddings.
+    :param indexing_helper: Helper used to upload the documents.
+    :param manifest: Manifest updated once the documents are indexed.
+    """
+    # One connection pool is shared by the embedding and indexing requests
+    async with create_async_client() as client:
+        # Step 3: Generate all embeddings in as few requests as possible
+        try:
+            embedding_vectors = await embedder.get_embeddings_async(
+                client,
+                [text_summary for _, text_summary in prepared],
+                max_concurrency=MAX_CONCURRENCY
+            )
+            logging.info(f"Generated {len(embedding_vectors)} embedding vector(s).")
+            print(f"Generated {len(embedding_vectors)} embedding vector(s).")
+        except Exception as e:
+            logging.error(f"Error generating embedding: {e}")
+            print(f"Error generating embedding: {e}")
+            return
 
-    # Step 3: Initialize and generate embedding
+        # Step 4: Build the search documents
+        doc_type = "result"  # Adjust based on your use case (e.g., 'folder', 'document', 'result')
+        metadata = ""  # Add any additional metadata if needed
+        search_docs = [
+            indexing_helper.build_search_doc(
+                doc_id=submission["_id"],
+                user_id=submission["user_id"],
+                folder_id=submission["folder_id"],
+                document_id=submission["document_id"],
+                doc_type=doc_type,
+                content_text=text_summary,
+                embedding_vector=embedding_vector,
+                metadata=metadata,
+                content_hash=content_hash(text_summary)
+            )
+            for (submission, text_summary), embedding_vector in zip(prepared, embedding_vectors)
+        ]
+
+        # Step 5: Index all documents in batches
+        try:
+            await indexing_helper.index_documents_async(client, search_docs)
+            manifest.update([(submission["_id"], text_summary) for submission, text_summary in prepared])
+            logging.info(f"Successfully indexed {len(search_docs)} document(s).")
+            print(f"Successfully indexed {len(search_docs)} document(s).")
+        except Exception as e:
+            logging.error(f"Error indexing documents: {e}")
+            print(f"Error indexing documents: {e}")
+            return
+
+async def run(submission_files: list):
+    """
+    Flatten all submissions, skip the unchanged ones, then embed and index the rest in batches.
+
+    :param submission_files: Paths to the submission JSON files.
+    """
+    # Initialize helpers
     try:
         embedder = EmbeddingHelper(env_file="local.env")
-        embedding_vector = embedder.get_embedding(text_summary)
-        logging.info(f"Generated embedding vector of length: {len(embedding_vector)}")
-        print(f"Generated embedding vector of length: {len(embedding_vector)}")
+        indexing_helper = IndexingHelper(env_file="local.env")
     except Exception as e:
-        logging.error(f"Error generating embedding: {e}")
-        print(f"Error generating embedding: {e}")
+        logging.error(f"Error initializing helpers: {e}")
+        print(f"Error initializing helpers: {e}")
+        return
+
+    # Loading and flattening is file-bound, so it is spread over a thread pool
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        prepared = [item for item in executor.map(prepare_submission, submission_files) if item is not None]
+    if not prepared:
+        logging.warning("No documents to index.")
+        print("No documents to index.")
         return
 
-    # Step 4: Initialize Indexing Helper and index the document
+    # Skip submissions whose flattened content has not changed since they were last indexed
+    manifest = IndexManifest(index_id(indexing_helper.endpoint, indexing_helper.index_name))
     try:
-        indexing_helper = IndexingHelper(env_file="local.env")
-        doc_id = submission.get("_id")
-        user_id = submission.get("user_id")
-        folder_id = submission.get("folder_id")
-        document_id = submission.get("document_id")
-        doc_type = "result"  # Adjust based on your use case (e.g., 'folder', 'document', 'result')
+        changed = [(submission, text_summary) for submission, text_summary in prepared
+                   if not manifest.is_unchanged(submission["_id"], text_summary)]
+        if len(changed) < len(prepared):
+            logging.info(f"Skipping {len(prepared) - len(changed)} unchanged document(s).")
+            print(f"Skipping {len(prepared) - len(changed)} unchanged document(s).")
+        if not changed:
+            logging.info("All documents are up to date.")
+            print("All documents are up to date.")
+            return
 
-        if not all([doc_id, user_id, folder_id, document_id]):
-            logging.error("Missing one or more required fields: '_id', 'user_id', 'folder_id', 'document_id'.")
-            print("Missing one or more required fields: '_id', 'user_id', 'folder_id', 'document_id'.")
-            raise ValueError("Incomplete submission data.")
+        await embed_and_index(changed, embedder, indexing_helper, manifest)
+    finally:
+        manifest.close()
 
-        metadata = ""  # Add any additional metadata if needed
+def main():
+    # Load environment variables
+    load_settings("local.env")
 
-        indexing_helper.index_document(
-            doc_id=doc_id,
-            user_id=user_id,
-            folder_id=folder_id,
-            document_id=document_id,
-            doc_type=doc_type,
-            content_text=text_summary,
-            embedding_vector=embedding_vector,
-            metadata=metadata
-        )
-        logging.info(f"Successfully indexed document ID: {doc_id}")
-        print(f"Successfully indexed document ID: {doc_id}")
-    except Exception as e:
-        logging.error(f"Error indexing document: {e}")
-        print(f"Error indexing document: {e}")
-        return
+    # Configuration
+    # Index every submission in RAG/submissions/, or the single RAG/submission.json if that folder is empty
+    SUBMISSION_FILES = sorted(glob.glob("RAG/submissions/*.json")) or ["RAG/submission.json"]
+
+    asyncio.run(run(SUBMISSION_FILES))
 
 if __name__ == "__main__":
     main()
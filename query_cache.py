@@ -0,0 +1,86 @@
+# query_cache.py
+
+"""
+Exact-match cache for user queries: a repeated query reuses the embedding and search
+results of its first occurrence, skipping both network round trips.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    def __init__(self, maxsize: int = 256, ttl: float = 300.0):
+        """
+        Initializes the QueryCache.
+
+        :param maxsize: Maximum number of entries kept; the least recently used entry is evicted first.
+        :param ttl: Seconds an entry stays valid, so newly indexed documents eventually show up.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(query: str, user_id: str = None) -> str:
+        """
+        Builds the cache key for a query. Queries differing only in case or surrounding
+        whitespace share a key; results are per user, so the user ID is part of it.
+
+        :param query: The user query.
+        :param user_id: The user the search results are filtered for.
+        :return: BLAKE2b hex digest of the user ID and normalized query.
+        """
+        normalized = f"{user_id or ''}\0{query.strip().lower()}"
+        return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str):
+        """
+        Looks up a query.
+
+        :param key: Key built with `QueryCache.key`.
+        :return: The cached value, or None on a miss or if the entry has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value) -> None:
+        """
+        Stores the value for a query.
+
+        :param key: Key built with `QueryCache.key`.
+        :param value: Value to return for the query, e.g. its embedding and search results.
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Removes every entry, e.g. after new documents were indexed.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss counters and the current number of entries.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
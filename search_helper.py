@@ -1,84 +1,181 @@
 # search_helper.py
 
-import os
-import requests
-from dotenv import load_dotenv
+from types import MappingProxyType
+import httpx
+import numpy as np
+from config import load_settings
 import logging
+from log_setup import configure_logging
 import json
+import orjson
+from http_helper import create_client, retry_transient
+from semantic_cache import SemanticCache
 
 # Configure logging
-logging.basicConfig(
-    filename='RAG/search_helper.log',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+configure_logging('RAG/search_helper.log')
 
 class SearchHelper:
+    __slots__ = ("endpoint", "api_key", "index_name", "api_version", "client", "semantic_cache", "_search_url", "_headers")
+
     def __init__(self, env_file: str = "local.env", index_definition_file: str = "index_definition.json"):
         """
         Initializes the SearchHelper by loading environment variables.
         """
-        load_dotenv(dotenv_path=env_file)
-        self.endpoint = os.getenv("ACS_ENDPOINT")
-        self.api_key = os.getenv("ACS_API_KEY")
-        self.index_name = os.getenv("ACS_INDEX_NAME", "knowledge-index")
-        self.api_version = os.getenv("ACS_API_VERSION", "2024-07-01")
+        settings = load_settings(env_file)
+        self.endpoint = settings.acs_endpoint
+        self.api_key = settings.acs_api_key
+        self.index_name = settings.acs_index_name or "knowledge-index"
+        self.api_version = settings.acs_api_version
         
         if not all([self.endpoint, self.api_key, self.index_name]):
             error_msg = "Azure Cognitive Search configuration is incomplete. Please check your .env file."
             logging.error(error_msg)
             raise ValueError(error_msg)
         
+        self.client = create_client(self.api_key)
+        self._search_url = f"{self.endpoint}/indexes('{self.index_name}')/docs/search.post.search?api-version={self.api_version}"
+        # Sent with async requests, whose shared client carries no default headers
+        self._headers = MappingProxyType({
+            "Content-Type": "application/json",
+            "api-key": self.api_key
+        })
+        # Reuses results for queries whose embeddings are nearly identical to an earlier one
+        self.semantic_cache = SemanticCache()
+        
         logging.info("Initialized SearchHelper.")
     
-    def vector_search(self, embedding: list, top_k: int = 5, user_id: str = None) -> dict:
+    def vector_search(
+        self,
+        embedding: list,
+        top_k: int = 5,
+        oversample: int = 5,
+        user_id: str = None,
+        use_cache: bool = True
+    ) -> dict:
         """
         Performs a vector search against the Azure Cognitive Search index.
         
-        :param embedding: The embedding vector to search with.
+        The HNSW query gathers `top_k * oversample` nearest neighbours and the best `top_k` of them
+        are returned, which gives noticeably better recall than asking HNSW for exactly `top_k`.
+        
+        :param embedding: The embedding vector to search with, as a numpy array or a list of floats.
         :param top_k: Number of top results to return.
+        :param oversample: Multiplier applied to `top_k` for the number of approximate neighbours gathered.
         :param user_id: The user ID to filter results. Defaults to None.
+        :param use_cache: Return cached results of a near-identical earlier query with the same parameters.
         :return: A dictionary containing search results.
         """
-        url = f"{self.endpoint}/indexes('{self.index_name}')/docs/search.post.search?api-version={self.api_version}"
-        headers = {
-            "Content-Type": "application/json",
-            "api-key": self.api_key
-        }
-        
+        cache_scope = (top_k, oversample, user_id)
+        if use_cache:
+            cached = self.semantic_cache.get(embedding, scope=cache_scope)
+            if cached is not None:
+                logging.info("Vector search served from the semantic cache.")
+                return cached
+
+        try:
+            response = self._post_search(self._build_search_body(embedding, top_k, oversample, user_id))
+            results = orjson.loads(response.content)
+            logging.info(f"Vector search successful. Retrieved {len(results.get('value', []))} documents.")
+            if use_cache:
+                self.semantic_cache.set(embedding, results, scope=cache_scope)
+            return results
+        except httpx.HTTPStatusError as http_err:
+            raise self._search_error(http_err)
+        except Exception as e:
+            logging.error(f"Error during vector search: {e}")
+            raise e
+
+    async def vector_search_async(
+        self,
+        client: httpx.AsyncClient,
+        embedding: list,
+        top_k: int = 5,
+        oversample: int = 5,
+        user_id: str = None,
+        use_cache: bool = True
+    ) -> dict:
+        """
+        Asynchronously performs a vector search against the Azure Cognitive Search index.
+        Takes the same parameters as `vector_search`.
+
+        :param client: httpx async client used to send the request.
+        :return: A dictionary containing search results.
+        """
+        cache_scope = (top_k, oversample, user_id)
+        if use_cache:
+            cached = self.semantic_cache.get(embedding, scope=cache_scope)
+            if cached is not None:
+                logging.info("Vector search served from the semantic cache.")
+                return cached
+
+        try:
+            response = await self._post_search_async(client, self._build_search_body(embedding, top_k, oversample, user_id))
+            results = orjson.loads(response.content)
+            logging.info(f"Vector search successful. Retrieved {len(results.get('value', []))} documents.")
+            if use_cache:
+                self.semantic_cache.set(embedding, results, scope=cache_scope)
+            return results
+        except httpx.HTTPStatusError as http_err:
+            raise self._search_error(http_err)
+        except Exception as e:
+            logging.error(f"Error during vector search: {e}")
+            raise e
+
+    @staticmethod
+    def _build_search_body(embedding: list, top_k: int, oversample: int, user_id: str) -> bytes:
+        """
+        Builds the serialized vector search request body.
+        """
+        # No "search" text: a pure vector query keeps `@search.score` a function of the cosine
+        # similarity, whereas a hybrid query would replace it with a reciprocal rank fusion score
         body = {
-            "search": "*",  # Wildcard search to enable vector search alongside other filters
             "vectorQueries": [
                 {
                     "kind": "vector",
-                    "vector": embedding,
+                    "vector": np.asarray(embedding, dtype=np.float32),
                     "fields": "contentVector",  # Ensure this matches your index's vector field
-                    "k": top_k,
-                    "exhaustive": False  # Set to True if you need exhaustive search
+                    "k": top_k * oversample,
+                    "exhaustive": False  # Approximate HNSW search
                 }
             ],
             "select": "id, userId, folderId, documentId, type, content, metadata",
             "top": top_k
         }
         
-        # Add user filter if user_id is provided
+        # Add user filter if user_id is provided, applied while traversing the HNSW graph
+        # so restrictive filters still yield top_k results
         if user_id:
             body["filter"] = f"userId eq '{user_id}'"
-            
+            body["vectorFilterMode"] = "preFilter"
+
+        return orjson.dumps(body, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    @staticmethod
+    def _search_error(http_err: httpx.HTTPStatusError) -> Exception:
+        """
+        Logs a failed search response and builds the exception raised for it.
+        """
         try:
-            response = requests.post(url, headers=headers, json=body)
-            response.raise_for_status()
-            results = response.json()
-            logging.info(f"Vector search successful. Retrieved {len(results.get('value', []))} documents.")
-            return results
-        except requests.exceptions.HTTPError as http_err:
-            try:
-                error_message = response.json().get("error", {}).get("message", str(http_err))
-            except json.JSONDecodeError:
-                error_message = str(http_err)
-            logging.error(f"HTTP error during vector search: {error_message}")
-            raise Exception(f"HTTP error during vector search: {error_message}")
-        except Exception as e:
-            logging.error(f"Error during vector search: {e}")
-            raise e
\ No newline at end of file
+            error_message = orjson.loads(http_err.response.content).get("error", {}).get("message", str(http_err))
+        except json.JSONDecodeError:
+            error_message = str(http_err)
+        logging.error(f"HTTP error during vector search: {error_message}")
+        return Exception(f"HTTP error during vector search: {error_message}")
+
+    @retry_transient
+    def _post_search(self, body: bytes) -> httpx.Response:
+        """
+        Sends a search request, backing off and retrying on throttling and transient failures.
+        """
+        response = self.client.post(self._search_url, content=body)
+        response.raise_for_status()
+        return response
+
+    @retry_transient
+    async def _post_search_async(self, client: httpx.AsyncClient, body: bytes) -> httpx.Response:
+        """
+        Asynchronously sends a search request, backing off and retrying on throttling and transient failures.
+        """
+        response = await client.post(self._search_url, headers=self._headers, content=body)
+        response.raise_for_status()
+        return response
@@ -0,0 +1,84 @@
+# semantic_cache.py
+
+"""
+Similarity-keyed cache: a lookup hits when a stored embedding is close enough to the
+query embedding, so slightly reworded queries reuse earlier results.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticCache:
+    def __init__(self, threshold: float = 0.98, maxsize: int = 256, ttl: float = 300.0):
+        """
+        Initializes the SemanticCache.
+
+        :param threshold: Minimum cosine similarity for a lookup to hit.
+        :param maxsize: Maximum number of entries kept; the least recently used entry is evicted first.
+        :param ttl: Seconds an entry stays valid, so newly indexed documents eventually show up.
+        """
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def get(self, embedding, scope=None):
+        """
+        Returns the value stored for the most similar embedding in the same scope.
+
+        :param embedding: Query embedding vector.
+        :param scope: Hashable value that must match exactly, e.g. the search parameters.
+        :return: The cached value, or None if no stored embedding is similar enough.
+        """
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            for entry_id in [entry_id for entry_id, entry in self._entries.items() if entry[3] <= now]:
+                del self._entries[entry_id]
+
+            candidates = [(entry_id, entry) for entry_id, entry in self._entries.items() if entry[0] == scope]
+            if not candidates:
+                return None
+
+            similarities = np.stack([entry[1] for _, entry in candidates]) @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            entry_id, entry = candidates[best]
+            self._entries.move_to_end(entry_id)
+            return entry[2]
+
+    def set(self, embedding, value, scope=None) -> None:
+        """
+        Stores a value for an embedding.
+
+        :param embedding: Query embedding vector.
+        :param value: Value to return for similar embeddings.
+        :param scope: Hashable value that lookups must match exactly.
+        """
+        entry = (scope, self._normalize(embedding), value, time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Removes every entry, e.g. after new documents were indexed.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,89 @@
+# uring_writer.py
+
+"""
+File appends submitted through io_uring on Linux when the optional `liburing` package is
+installed, with plain os.write calls everywhere else.
+"""
+
+import logging
+import os
+import sys
+
+try:
+    import liburing
+except ImportError:
+    liburing = None
+
+
+class UringWriter:
+    def __init__(self, entries: int = 8):
+        """
+        Initializes the UringWriter. A writer must only be used from one thread at a time.
+
+        :param entries: Size of the io_uring submission queue.
+        """
+        self._ring = None
+        self._cqe = None
+
+        if liburing is None or not sys.platform.startswith("linux"):
+            return
+
+        ring = liburing.Ring()
+        try:
+            liburing.io_uring_queue_init(entries, ring)
+        except OSError as e:
+            # e.g. io_uring disabled by the kernel or a seccomp policy
+            logging.warning(f"io_uring is unavailable, using plain writes: {e}")
+            return
+        self._ring = ring
+        self._cqe = liburing.Cqe()
+
+    @property
+    def uses_uring(self) -> bool:
+        """
+        True when writes are submitted through io_uring.
+        """
+        return self._ring is not None
+
+    def append(self, file_path: str, data: bytes) -> None:
+        """
+        Appends data to a file, creating it if needed.
+
+        :param file_path: Path of the file.
+        :param data: Bytes to append.
+        """
+        fd = os.open(file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            while data:
+                written = self._write(fd, data)
+                data = data[written:]
+        finally:
+            os.close(fd)
+
+    def _write(self, fd: int, data: bytes) -> int:
+        """
+        Writes data to a file descriptor once.
+
+        :return: Number of bytes written.
+        """
+        if self._ring is None:
+            return os.write(fd, data)
+
+        sqe = liburing.io_uring_get_sqe(self._ring)
+        liburing.io_uring_prep_write(sqe, fd, data)
+        # Submitting and waiting for the completion takes a single system call
+        liburing.io_uring_submit_and_wait(self._ring, 1)
+        liburing.io_uring_wait_cqe(self._ring, self._cqe)
+        try:
+            return liburing.trap_error(self._cqe[0].res)
+        finally:
+            liburing.io_uring_cqe_seen(self._ring, self._cqe[0])
+
+    def close(self) -> None:
+        """
+        Releases the io_uring; later writes use plain os.write calls.
+        """
+        if self._ring is not None:
+            liburing.io_uring_queue_exit(self._ring)
+            self._ring = None
+            self._cqe = None
@@ -1,44 +1,191 @@
 # main.py
 
 import os
-import json
+import sys
+import orjson
+import asyncio
+import atexit
+import queue
+import threading
+import time
+from collections import deque
+import shutil
+from datetime import datetime
+import numpy as np
 from embedding_helper import EmbeddingHelper
+from http_helper import create_async_client
+from query_cache import QueryCache
 from search_helper import SearchHelper
-from dotenv import load_dotenv
+from uring_writer import UringWriter
+from functools import lru_cache
+from config import load_settings
 import logging
+from log_setup import configure_logging
 import openai
 
 # Configure logging
-logging.basicConfig(
-    filename='RAG/user_query.log',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-
-CONVERSATION_HISTORY_FILE = "RAG/conversation_history.json"  # Path to conversation history file
+configure_logging('RAG/user_query.log')
+
+# Environment settings, read once at import
+_SETTINGS = load_settings("local.env")
+CHAT_MODEL = _SETTINGS.openai_chat_model
+USER_ID = _SETTINGS.current_user_id
+MAX_HISTORY_TURNS = int(os.getenv("MAX_HISTORY_TURNS", "10"))  # Previous question/answer turns sent to the chat model
+# Recent user turns embedded together with the query to give follow-up questions their
+# conversational context (0 embeds the query alone)
+HISTORY_EMBED_TURNS = int(os.getenv("HISTORY_EMBED_TURNS", "0"))
+RAG_DEBUG = bool(os.getenv("RAG_DEBUG"))  # Print the retrieved documents before the answer
+
+CONVERSATION_HISTORY_FILE = "RAG/conversation_history.jsonl"  # Path to conversation history file
+CONVERSATION_ARCHIVE_DIR = "RAG/conversation_history_archives"  # Monthly archives of older messages
+LEGACY_CONVERSATION_HISTORY_FILE = "RAG/conversation_history.json"  # JSON array written by earlier versions
+HISTORY_WEIGHT = 0.3  # Share of the search vector taken by the recent turns
+# Messages read back from the history file: enough for the chat prompt and the embedded turns
+HISTORY_TAIL_MESSAGES = 2 * max(MAX_HISTORY_TURNS, HISTORY_EMBED_TURNS)
+# Seconds the history writer waits for more messages before appending them in one write
+HISTORY_FLUSH_INTERVAL = 0.2
+
+# Messages waiting to be appended to the history file by the writer thread
+_history_queue = queue.Queue()
+_history_writer = None
+_history_writer_lock = threading.Lock()
+
+# Embeddings and search results of recent queries, shared by every run() in this process
+QUERY_CACHE = QueryCache()
+# Minimum cosine similarity between the previous and the new query embedding for the search
+# started speculatively with the previous one to be used
+SPECULATIVE_SEARCH_THRESHOLD = 0.98
+# Embedding of the previous query answered in this process, used to start the next search early
+_last_query_embedding = None
+# Retrieved documents sent to the chat model: at most this many, each at least this similar to the query
+MAX_CONTEXT_DOCUMENTS = 3
+MIN_CONTEXT_SIMILARITY = 0.75
+
+# System prompt for Chat Completion, shared by every request and never modified
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "You are an AI assistant that helps answer questions based on provided documents. "
+        "Use the information from the documents and the recent conversation history to answer. "
+        "Each document is listed by its ID and a snippet; call get_document to read the full "
+        "content of a document when the snippet is not enough."
+    )
+}
+SNIPPET_LENGTH = 300  # Characters of each document included in the prompt
+MAX_DOCUMENT_FETCHES = 3  # Full documents the chat model may fetch per answer
+
+# Function the chat model calls to read the full content of a listed document
+CHAT_FUNCTIONS = [
+    {
+        "name": "get_document",
+        "description": "Returns the full content of one of the provided documents.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "id": {"type": "string", "description": "ID of the document, as listed in the prompt."}
+            },
+            "required": ["id"]
+        }
+    }
+]
 
 
 def load_env(env_file: str = "local.env"):
     """
-    Loads environment variables from a .env file.
+    Loads environment variables from a .env file. The file is only parsed once per process.
     """
-    load_dotenv(dotenv_path=env_file)
+    load_settings(env_file)
     logging.info("Loaded environment variables.")
 
 
-def load_conversation_history() -> list:
+def _migrate_legacy_history() -> None:
+    """
+    Imports the JSON array written by earlier versions into the JSONL history once, ahead of
+    any messages already appended, and renames the old file to `.bak`.
+    """
+    if not os.path.exists(LEGACY_CONVERSATION_HISTORY_FILE):
+        return
+
+    with open(LEGACY_CONVERSATION_HISTORY_FILE, "rb") as f:
+        legacy_messages = orjson.loads(f.read())
+
+    temp_file = CONVERSATION_HISTORY_FILE + ".tmp"
+    with open(temp_file, "wb") as dst:
+        dst.write(b"".join(orjson.dumps(message) + b"\n" for message in legacy_messages))
+        if os.path.exists(CONVERSATION_HISTORY_FILE):
+            with open(CONVERSATION_HISTORY_FILE, "rb") as src:
+                shutil.copyfileobj(src, dst)
+    os.replace(temp_file, CONVERSATION_HISTORY_FILE)
+    os.replace(LEGACY_CONVERSATION_HISTORY_FILE, LEGACY_CONVERSATION_HISTORY_FILE + ".bak")
+    logging.info(
+        f"Imported {len(legacy_messages)} messages from '{LEGACY_CONVERSATION_HISTORY_FILE}' into '{CONVERSATION_HISTORY_FILE}'."
+    )
+
+
+def _rotate_conversation_history() -> None:
+    """
+    Moves the conversation history into the monthly archive once a new month has started, so
+    the active file mostly holds the current month's messages. The last HISTORY_TAIL_MESSAGES
+    messages stay in the active file, so the first question of a month still has its context;
+    they are archived with the following month.
+    """
+    if not os.path.exists(CONVERSATION_HISTORY_FILE):
+        return
+
+    month = datetime.fromtimestamp(os.path.getmtime(CONVERSATION_HISTORY_FILE)).strftime("%Y-%m")
+    if month == datetime.now().strftime("%Y-%m"):
+        return
+
+    with open(CONVERSATION_HISTORY_FILE, "rb") as f:
+        lines = f.readlines()
+    split = max(len(lines) - HISTORY_TAIL_MESSAGES, 0)
+
+    os.makedirs(CONVERSATION_ARCHIVE_DIR, exist_ok=True)
+    archive_file = os.path.join(CONVERSATION_ARCHIVE_DIR, f"{month}.jsonl")
+    # Append in case the archive already holds messages from that month
+    with open(archive_file, "ab") as dst:
+        dst.writelines(lines[:split])
+
+    # Rewriting the tail also sets the file's modification time to the current month
+    temp_file = CONVERSATION_HISTORY_FILE + ".tmp"
+    with open(temp_file, "wb") as dst:
+        dst.writelines(lines[split:])
+    os.replace(temp_file, CONVERSATION_HISTORY_FILE)
+    logging.info(f"Archived conversation history to '{archive_file}'.")
+
+
+@lru_cache(maxsize=2)
+def _read_conversation_history(file_path: str, mtime_ns: int, max_messages: int = None) -> tuple:
+    """
+    Parses the JSONL conversation history. The modification time is part of the cache key,
+    so the file is only parsed again once it has changed. When `max_messages` is given, only
+    the last lines are kept while reading, so only those are parsed.
+    """
+    if max_messages == 0:
+        return ()
+    with open(file_path, "rb") as f:
+        lines = deque(f, maxlen=max_messages) if max_messages is not None else f
+        return tuple(orjson.loads(line) for line in lines if line.strip())
+
+
+def load_conversation_history(max_messages: int = HISTORY_TAIL_MESSAGES) -> list:
     """
-    Loads conversation history from a JSON file.
+    Loads the most recent messages of the conversation history from a JSONL file, one message per line.
 
+    :param max_messages: Number of most recent messages to load. Pass None to load the whole history.
     :return: A list of conversation history messages.
     """
     try:
+        # Wait for queued messages to be written, so they are part of the history read back
+        _history_queue.join()
+        _migrate_legacy_history()
+        _rotate_conversation_history()
         if os.path.exists(CONVERSATION_HISTORY_FILE):
-            with open(CONVERSATION_HISTORY_FILE, "r", encoding="utf-8") as f:
-                history = json.load(f)
-                logging.info(f"Loaded conversation history from '{CONVERSATION_HISTORY_FILE}'.")
-                return history
+            mtime_ns = os.stat(CONVERSATION_HISTORY_FILE).st_mtime_ns
+            # The cached messages are shared, so a new list is returned for the caller to extend
+            history = list(_read_conversation_history(CONVERSATION_HISTORY_FILE, mtime_ns, max_messages))
+            logging.info(f"Loaded conversation history from '{CONVERSATION_HISTORY_FILE}'.")
+            return history
         else:
             logging.info(f"No conversation history file found. Starting fresh.")
             return []
@@ -47,20 +194,147 @@ def load_conversation_history() -> list:
         return []
 
 
-def save_conversation_history(history: list) -> None:
+def _append_conversation_history(writer: UringWriter, messages: list) -> None:
     """
-    Saves the conversation history to a JSON file.
+    Appends messages to the JSONL conversation history file.
 
-    :param history: A list of conversation history messages.
+    :param writer: Writer used to append to the file.
+    :param messages: The conversation history messages to append.
     """
     try:
-        with open(CONVERSATION_HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, ensure_ascii=False, indent=4)
+        _migrate_legacy_history()
+        _rotate_conversation_history()
+        # orjson writes UTF-8 directly, so non-ASCII text is stored unescaped
+        writer.append(CONVERSATION_HISTORY_FILE, b"".join(orjson.dumps(message) + b"\n" for message in messages))
         logging.info(f"Conversation history saved to '{CONVERSATION_HISTORY_FILE}'.")
     except Exception as e:
         logging.error(f"Error saving conversation history: {e}")
 
 
+def _history_writer_loop() -> None:
+    """
+    Drains the history queue on the writer thread. Messages queued within
+    HISTORY_FLUSH_INTERVAL of each other are appended in a single write, submitted
+    through io_uring where available.
+    """
+    writer = UringWriter()
+    while True:
+        messages = _history_queue.get()
+        received = 1
+        stop = messages is None
+        batch = [] if stop else list(messages)
+
+        deadline = time.monotonic() + HISTORY_FLUSH_INTERVAL
+        while not stop:
+            try:
+                messages = _history_queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            received += 1
+            if messages is None:
+                stop = True
+            else:
+                batch.extend(messages)
+
+        if batch:
+            _append_conversation_history(writer, batch)
+        for _ in range(received):
+            _history_queue.task_done()
+        if stop:
+            writer.close()
+            return
+
+
+def _stop_history_writer() -> None:
+    """
+    Writes the messages still in the queue and stops the writer thread.
+    """
+    _history_queue.put(None)
+    _history_writer.join()
+
+
+def save_conversation_history(new_messages: list) -> None:
+    """
+    Queues the messages added during this turn to be appended to the JSONL conversation
+    history file by a background thread, so the caller never waits on the disk.
+
+    :param new_messages: The conversation history messages added since it was loaded.
+    """
+    global _history_writer
+    with _history_writer_lock:
+        if _history_writer is None:
+            _history_writer = threading.Thread(target=_history_writer_loop, name="history-writer", daemon=True)
+            _history_writer.start()
+            # Write queued messages before the process exits
+            atexit.register(_stop_history_writer)
+    _history_queue.put(new_messages)
+
+
+def blend_query_embedding(embeddings: list) -> np.ndarray:
+    """
+    Combines the query embedding with the embeddings of recent user turns into one search vector.
+
+    :param embeddings: The query embedding followed by the embeddings of the recent turns.
+    :return: The normalized search vector.
+    """
+    query_vector = embeddings[0]
+    if len(embeddings) == 1:
+        return query_vector
+
+    history_vector = np.mean(embeddings[1:], axis=0)
+    blended = (1 - HISTORY_WEIGHT) * query_vector + HISTORY_WEIGHT * history_vector
+    return blended / np.linalg.norm(blended)
+
+
+def select_context_documents(documents: list) -> list:
+    """
+    Keeps the retrieved documents that are similar enough to the query to be worth sending to
+    the chat model, most similar first.
+
+    The index uses the cosine metric, for which Azure Cognitive Search reports
+    `@search.score = 1 / (2 - cosine)` on pure vector queries, so the similarities are recovered
+    from the scores without fetching the document vectors. Scores outside that formula's range
+    (e.g. reciprocal rank fusion scores of a hybrid query) cannot be converted, in which case
+    the documents are kept in search order without the similarity threshold.
+
+    :param documents: Documents returned by the vector search.
+    :return: At most MAX_CONTEXT_DOCUMENTS documents with a cosine similarity above MIN_CONTEXT_SIMILARITY.
+    """
+    if not documents:
+        return []
+
+    scores = np.array([doc['@search.score'] for doc in documents], dtype=np.float32)
+    # 1 / (2 - cosine) ranges from 1/3 (cosine -1) to 1 (cosine 1)
+    if scores.min() < 1.0 / 3.0 - 1e-6 or scores.max() > 1.0 + 1e-6:
+        logging.warning(
+            f"Search scores between {scores.min():.4f} and {scores.max():.4f} are not cosine vector scores; "
+            f"skipping the similarity threshold."
+        )
+        return documents[:MAX_CONTEXT_DOCUMENTS]
+
+    similarities = 2.0 - 1.0 / scores
+    order = np.argsort(-similarities, kind="stable")[:MAX_CONTEXT_DOCUMENTS]
+    return [documents[i] for i in order if similarities[i] > MIN_CONTEXT_SIMILARITY]
+
+
+def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Returns the cosine similarity of two vectors.
+    """
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+async def _discard(task) -> None:
+    """
+    Cancels a speculative task that is no longer needed and waits for it to finish.
+
+    :param task: The task, or None if none was started.
+    """
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
 def get_user_query(file_path: str = "RAG/query.txt") -> str:
     """
     Loads the user query from a text file.
@@ -82,9 +356,133 @@ def get_user_query(file_path: str = "RAG/query.txt") -> str:
         raise e
 
 
+@lru_cache(maxsize=32)
+def _join_context(documents: tuple) -> str:
+    """
+    Builds the context passed to the chat model: the ID and a snippet of every document.
+    Turns that retrieve the same documents reuse the joined string.
+
+    :param documents: (id, content) pairs of the retrieved documents.
+    """
+    return "\n".join(
+        f"[{doc_id}] {content[:SNIPPET_LENGTH]}{'...' if len(content) > SNIPPET_LENGTH else ''}"
+        for doc_id, content in documents
+    )
+
+
+def _get_document(documents_by_id: dict, arguments: str) -> str:
+    """
+    Handles a `get_document` call from the chat model.
+
+    :param documents_by_id: Retrieved documents keyed by ID.
+    :param arguments: JSON arguments of the function call.
+    :return: The full content of the requested document, or an error message for the model.
+    """
+    try:
+        doc_id = orjson.loads(arguments)["id"]
+    except (orjson.JSONDecodeError, KeyError, TypeError):
+        return "Invalid arguments: expected {\"id\": \"<document id>\"}."
+
+    doc = documents_by_id.get(doc_id)
+    if doc is None:
+        return f"Document '{doc_id}' is not one of the provided documents."
+    logging.info(f"Chat model fetched the full content of document '{doc_id}'.")
+    return doc['content']
+
+
+def _create_chat_completion(messages: list, stream: bool = False, allow_fetch: bool = True):
+    """
+    Sends the chat messages to the OpenAI chat model.
+
+    :param messages: The chat messages to send.
+    :param stream: Whether the response is streamed back chunk by chunk.
+    :param allow_fetch: Whether the model may call `get_document` instead of answering.
+    :return: The chat completion, or an iterator of completion chunks when streaming.
+    """
+    return openai.ChatCompletion.create(
+        engine=CHAT_MODEL,
+        messages=messages,
+        functions=CHAT_FUNCTIONS,
+        function_call="auto" if allow_fetch else "none",
+        max_tokens=250,  # Limit the response to 250 tokens
+        temperature=0.5,
+        n=1,
+        stop=None,
+        stream=stream
+    )
+
+
+def stream_chat_answer(messages: list, allow_fetch: bool = True) -> dict:
+    """
+    Streams the chat model's answer to stdout as it is generated. If the stream fails before
+    any of the answer was written, a single non-streamed completion is requested instead.
+
+    :param messages: The chat messages to send.
+    :param allow_fetch: Whether the model may call `get_document` instead of answering.
+    :return: The assistant message: either the complete answer or a function call.
+    """
+    parts = []
+    name_parts = []
+    argument_parts = []
+    try:
+        response = _create_chat_completion(messages, stream=True, allow_fetch=allow_fetch)
+        for chunk in response:
+            # Azure may send chunks without choices (e.g. content filter results)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].get("delta", {})
+            token = delta.get("content")
+            if token:
+                sys.stdout.write(token)
+                sys.stdout.flush()
+                parts.append(token)
+            function_call = delta.get("function_call")
+            if function_call:
+                name_parts.append(function_call.get("name") or "")
+                argument_parts.append(function_call.get("arguments") or "")
+    except Exception as e:
+        if parts:
+            # Part of the answer is already on screen and a new completion would not continue it
+            sys.stdout.write("\n")
+            raise
+        logging.warning(f"Streaming chat completion failed, retrying without streaming: {e}")
+        return _complete_chat(messages, allow_fetch)
+
+    if name_parts:
+        return {
+            "role": "assistant",
+            "content": None,
+            "function_call": {"name": "".join(name_parts), "arguments": "".join(argument_parts)}
+        }
+
+    sys.stdout.write("\n")
+    return {"role": "assistant", "content": "".join(parts).strip()}
+
+
+def _complete_chat(messages: list, allow_fetch: bool) -> dict:
+    """
+    Gets the next assistant message from a single, non-streamed completion and prints the answer.
+
+    :param messages: The chat messages to send.
+    :param allow_fetch: Whether the model may call `get_document` instead of answering.
+    :return: The assistant message: either the complete answer or a function call.
+    """
+    message = _create_chat_completion(messages, allow_fetch=allow_fetch).choices[0].message
+    if message.get("function_call"):
+        return {
+            "role": "assistant",
+            "content": None,
+            "function_call": {"name": message.function_call.name, "arguments": message.function_call.arguments}
+        }
+    answer = (message.get("content") or "").strip()
+    print(answer)
+    return {"role": "assistant", "content": answer}
+
+
 def process_results_with_openai_chat(results: list, user_query: str, conversation_history: list) -> str:
     """
     Uses OpenAI's chat model to generate a response based on search results and conversation history.
+    The response is written to stdout while it is being generated.
 
     :param results: List of documents retrieved from the search.
     :param user_query: The original user query.
@@ -95,30 +493,32 @@ def process_results_with_openai_chat(results: list, user_query: str, conversatio
         # Add the user query to conversation history
         conversation_history.append({"role": "user", "content": user_query})
 
-        # Include search results as context
-        context = "\n\n".join([doc['content'] for doc in results])
-
-        # Build the prompt for Chat Completion
-        system_message = (
-            "You are an AI assistant that helps answer questions based on provided documents. "
-            "Use the information from the documents and the recent conversation history to answer."
-        )
+        # Include snippets of the search results as context; the model fetches the full
+        # content of the documents it needs through `get_document`
+        context = _join_context(tuple((doc['id'], doc['content']) for doc in results))
+        documents_by_id = {doc['id']: doc for doc in results}
 
-        # Add conversation history and context to the messages
-        messages = [{"role": "system", "content": system_message}] + conversation_history
+        # Add the most recent turns of the conversation and context to the messages, so the
+        # prompt size stays bounded as the history grows (the last message is the current query)
+        messages = [SYSTEM_MESSAGE]
+        messages.extend(conversation_history[-(2 * MAX_HISTORY_TURNS + 1):])
         messages.append({"role": "system", "content": f"Documents:\n{context}"})
 
-        response = openai.ChatCompletion.create(
-            engine=os.getenv("OPENAI_CHAT_MODEL", "gpt-4"),
-            messages=messages,
-            max_tokens=250,  # Limit the response to 250 tokens
-            temperature=0.5,
-            n=1,
-            stop=None
-        )
-
-        # Extract the answer
-        answer = response.choices[0].message['content'].strip()
+        # The last request does not allow further fetches, so the model has to answer
+        for fetches in range(MAX_DOCUMENT_FETCHES + 1):
+            message = stream_chat_answer(messages, allow_fetch=fetches < MAX_DOCUMENT_FETCHES)
+            function_call = message.get("function_call")
+            if function_call is None:
+                answer = message["content"]
+                break
+            messages.append(message)
+            messages.append({
+                "role": "function",
+                "name": function_call["name"],
+                "content": _get_document(documents_by_id, function_call["arguments"])
+            })
+        else:
+            raise Exception("The chat model did not answer after fetching documents.")
 
         # Add the assistant's response to conversation history
         conversation_history.append({"role": "assistant", "content": answer})
@@ -128,23 +528,36 @@ def process_results_with_openai_chat(results: list, user_query: str, conversatio
     except Exception as e:
         logging.error(f"Error generating response with OpenAI Chat Completion: {e}")
         print(e)
-        return "I'm sorry, I couldn't generate a response at this time."
+        answer = "I'm sorry, I couldn't generate a response at this time."
+        print(answer)
+        return answer
 
 
-def main():
-    # Load environment variables
-    load_env()
+@lru_cache(maxsize=1)
+def _embedder() -> EmbeddingHelper:
+    """
+    Returns the EmbeddingHelper shared by every run; its caches are safe to use from several threads.
+    """
+    return EmbeddingHelper()
 
-    # Initialize OpenAI with new endpoint and key
-    openai.api_base = os.getenv("OPENAI_API_BASE")
-    openai.api_key = os.getenv("OPENAI_API_KEY")
 
-    # Initialize helpers
-    embedder = EmbeddingHelper()
-    searcher = SearchHelper()
+@lru_cache(maxsize=1)
+def _searcher() -> SearchHelper:
+    """
+    Returns the SearchHelper shared by every run, so its HTTP client and semantic cache are reused.
+    """
+    return SearchHelper()
+
 
-    # Load conversation history
-    conversation_history = load_conversation_history()
+async def run():
+    """
+    Answers the user query. The conversation history is loaded while the query is being
+    embedded, and written in the background once the answer has been generated.
+    """
+    global _last_query_embedding
+    # Helpers are created once and shared by every run in this process
+    embedder = _embedder()
+    searcher = _searcher()
 
     # Get user query from query.txt
     try:
@@ -153,48 +566,111 @@ def main():
         print(f"Error loading user query: {e}")
         return
 
-    # Generate embedding
-    try:
-        embedding = embedder.get_embedding(user_query)
-    except Exception as e:
-        logging.error(f"Failed to generate embedding: {e}")
-        print("Error generating embedding. Please try again later.")
+    # A repeated query reuses the embedding and documents retrieved for it earlier. Embeddings
+    # blended with recent turns depend on the history, so they are not cached.
+    cache_key = QueryCache.key(user_query, USER_ID)
+    cached = None if HISTORY_EMBED_TURNS else QUERY_CACHE.get(cache_key)
+    if cached is not None:
+        logging.info("Query served from the query cache.")
+        embedding, documents = cached
+        conversation_history = await asyncio.to_thread(load_conversation_history)
+    else:
+        speculative_search = None
+        # One connection pool is shared by the embedding and search requests
+        async with create_async_client() as client:
+            try:
+                if HISTORY_EMBED_TURNS:
+                    # Embed the query and the recent user turns in a single request
+                    conversation_history = await asyncio.to_thread(load_conversation_history)
+                    recent_turns = [message["content"] for message in conversation_history if message["role"] == "user"]
+                    embeddings = await embedder.get_query_embeddings_async(
+                        client,
+                        [user_query, *recent_turns[-HISTORY_EMBED_TURNS:]]
+                    )
+                    embedding = blend_query_embedding(embeddings)
+                else:
+                    # A new query is often a rephrasing of the previous one, so while it is embedded
+                    # the search is started with the previous query's embedding. Embeddings already
+                    # in the query cache are returned at once, leaving no latency to hide.
+                    speculative_embedding = _last_query_embedding
+                    if speculative_embedding is not None and embedder.query_cache.get(user_query) is None:
+                        speculative_search = asyncio.create_task(
+                            searcher.vector_search_async(client, embedding=speculative_embedding, top_k=5, user_id=USER_ID)
+                        )
+
+                    # Load conversation history and generate the embedding concurrently
+                    conversation_history, embedding = await asyncio.gather(
+                        asyncio.to_thread(load_conversation_history),
+                        embedder.get_query_embedding_async(client, user_query)
+                    )
+            except Exception as e:
+                await _discard(speculative_search)
+                logging.error(f"Failed to generate embedding: {e}")
+                print("Error generating embedding. Please try again later.")
+                return
+
+            # Perform vector search, keeping the speculative one if its embedding matches
+            try:
+                search_results = None
+                if (speculative_search is not None
+                        and _cosine_similarity(speculative_embedding, embedding) >= SPECULATIVE_SEARCH_THRESHOLD):
+                    logging.info("Using the speculative vector search.")
+                    try:
+                        search_results = await speculative_search
+                    except Exception as e:
+                        logging.warning(f"Speculative vector search failed, searching again: {e}")
+                else:
+                    await _discard(speculative_search)
+                if search_results is None:
+                    search_results = await searcher.vector_search_async(client, embedding=embedding, top_k=5, user_id=USER_ID)
+                documents = search_results.get('value', [])
+                if not documents:
+                    print("No relevant documents found.")
+                    return
+            except Exception as e:
+                logging.error(f"Vector search failed: {e}")
+                print(f"Error performing search: {e}")
+                return
+
+        if not HISTORY_EMBED_TURNS:
+            QUERY_CACHE.set(cache_key, (embedding, documents))
+
+    if not HISTORY_EMBED_TURNS:
+        _last_query_embedding = embedding
+
+    # Only the documents closest to the query are sent to the chat model
+    documents = select_context_documents(documents)
+    if not documents:
+        print("No relevant documents found.")
         return
-    
-    # Retrieve the userId from the environment or session
-    user_id = os.getenv("CURRENT_USER_ID", "userXYZ")
 
-    # Perform vector search
-    try:
-        search_results = searcher.vector_search(embedding=embedding, top_k=5, user_id=user_id)
-        documents = search_results.get('value', [])
-        if not documents:
-            print("No relevant documents found.")
-            return
-    except Exception as e:
-        logging.error(f"Vector search failed: {e}")
-        print(f"Error performing search: {e}")
-        return
-
-    # Display retrieved documents (optional)
-    print("\nTop Relevant Documents:")
-    for idx, doc in enumerate(documents, start=1):
-        print(f"\nDocument {idx}:")
-        print(f"ID: {doc['id']}")
-        print(f"Type: {doc['type']}")
-        print(f"Content: {doc['content']}")
-        print(f"Metadata: {doc['metadata']}")
+    # Display retrieved documents when RAG_DEBUG is set, in a single write
+    if RAG_DEBUG:
+        sys.stdout.write("\nTop Relevant Documents:\n" + "".join(
+            f"\nDocument {idx}:\nID: {doc['id']}\nType: {doc['type']}\nContent: {doc['content']}\nMetadata: {doc['metadata']}\n"
+            for idx, doc in enumerate(documents, start=1)
+        ))
 
     # Generate response using OpenAI Chat Completion
+    # The answer is printed as it streams in
+    print("\nAnswer:")
+    history_length = len(conversation_history)
     try:
-        answer = process_results_with_openai_chat(documents, user_query, conversation_history)
-        print(f"\nAnswer:\n{answer}")
+        process_results_with_openai_chat(documents, user_query, conversation_history)
     except Exception as e:
         logging.error(f"Failed to generate answer with OpenAI Chat Completion: {e}")
         print("Error generating answer. Please try again later.")
 
-    # Save updated conversation history
-    save_conversation_history(conversation_history)
+    # Save updated conversation history; the write happens on the history writer thread
+    save_conversation_history(conversation_history[history_length:])
+
+
+def main():
+    # Load environment variables
+    load_env()
+
+    # The OpenAI client is configured for Azure once, when the shared EmbeddingHelper is created
+    asyncio.run(run())
 
 
 if __name__ == "__main__":